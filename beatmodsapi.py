@@ -9,8 +9,6 @@
 
 __version__ = [2, 2, 0]
 
-from urllib import request
-import zlib
 import json
 import logging
 import enum
@@ -18,12 +16,69 @@ import pathlib
 import zipfile
 import hashlib
 import os
+import shutil
+import gzip
+import zlib
+import time
+from urllib.parse import urlencode
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger("beatmods.API")
 
+#orjson is a lot faster at parsing the mod listings, but it is optional
+if orjson:
+    _loads = orjson.loads
+    def _dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    _loads = json.loads
+    _dumps = json.dumps
+
 API_URL = "https://beatmods.com/api/v1/"
 APP_TYPE = "steam"
-WBITS = 47 #Unsure what beatmods.com uses but 47 seems to work just fine
+REMOTE_CACHE_TTL = 12 * 60 * 60 #Seconds before a cached mod listing is revalidated
+DOWNLOAD_WORKERS = 8 #Number of mod archives downloaded in parallel
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+HASH_CHUNK_SIZE = 64 * 1024
+
+_HEADERS = {
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/73.0.3683.86 Safari/537.36",
+    "accept": "application/json",
+    "accept-encoding": "gzip, deflate",
+    "referer": "https://beatmods.com/"
+    }
+
+def createSession():
+
+    """
+    Create a requests.Session set up for talking to beatmods.com.
+
+    Sessions keep connections alive, which saves a TCP and TLS
+    handshake for every request after the first one. The connection
+    pool is large enough for parallel downloads and failed requests
+    are retried a few times.
+    """
+
+    session = requests.Session()
+    session.headers.update(_HEADERS)
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+    adapter = HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+#Session used when the caller doesn't provide their own
+_session = createSession()
 
 def validateFile(data, hash):
 
@@ -38,40 +93,104 @@ def validateFile(data, hash):
 
     return h.hexdigest().lower() == hash.lower()
 
-def _getEndpoint(endpoint):
+def _getEndpoint(endpoint, session=None):
 
     """
-    Get a urllib.request.Request object to access
+    Get the session and URL needed to access
     the specified API endpoint.
 
     Please specify the endpoint after https://beatmods.com/api/v1/
 
-    The returned Request will have all required
-    headers that are needed to get a response.
+    The returned session will have all required
+    headers that are needed to get a response. If session
+    is None, the module wide session is used.
     """
 
     logger.debug("Requesting API endpoint %s" % endpoint)
-    req = request.Request(API_URL + endpoint)
-    req.add_header("user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/73.0.3683.86 Safari/537.36")
-    req.add_header("accept", "application/json")
-    req.add_header("accept-encoding", "gzip")
-    req.add_header("referer", "https://beatmods.com/")
-    return req
+    return session or _session, API_URL + endpoint
+
+def _readCache(cache, key):
+
+    """
+    Load the metadata of a cached API response.
+
+    Returns None if there is no usable cache entry for key.
+    """
+
+    try:
+        with open(os.path.join(cache, key + ".json"), "rb") as f:
+            meta = _loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+    if not os.path.isfile(os.path.join(cache, key + ".gz")):
+        return None
+    return meta
+
+def _readCacheBody(cache, key):
+
+    """
+    Load the body of a cached API response.
+
+    Returns None if the body is missing or damaged, in which case
+    the entry should be treated as a cache miss.
+    """
+
+    try:
+        with open(os.path.join(cache, key + ".gz"), "rb") as f:
+            return _loads(gzip.decompress(f.read()))
+    except (OSError, EOFError, ValueError, zlib.error) as e:
+        logger.warning("Discarding damaged response cache: %s" % str(e))
+        return None
+
+def _writeCacheFile(path, data):
+
+    """
+    Atomically replace the file at path with data.
+    """
+
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
 
-def _parsePayload(data, is_compressed=True, comp_wbits=WBITS):
+def _writeCache(cache, key, res):
 
     """
-    Parse the return payload from an API call.
-    Supports zlib compression.
+    Store an API response in the cache directory.
+
+    The body is kept gzip compressed, alongside a small JSON file
+    holding the headers needed to revalidate it later. Responses
+    without validators are still cached, so they can be reused
+    until they reach their max age.
     """
 
-    if is_compressed:
-        logger.debug("Using ZLIB compression with %i wbits" % comp_wbits)
-        data = zlib.decompress(data, wbits=comp_wbits)
+    meta = {
+        "etag": res.headers.get("etag"),
+        "last_modified": res.headers.get("last-modified")
+        }
 
-    return json.loads(data)
+    data = _dumps(meta).encode("utf-8")
+    try:
+        #drop the old metadata first, so an interrupted write can
+        #never leave validators pointing to a body they don't describe
+        try:
+            os.remove(os.path.join(cache, key + ".json"))
+        except FileNotFoundError:
+            pass
+        _writeCacheFile(os.path.join(cache, key + ".gz"), gzip.compress(res.content))
+        _writeCacheFile(os.path.join(cache, key + ".json"), data)
+    except OSError as e:
+        logger.warning("Unable to write response cache: %s" % str(e))
 
-def getBeatModsList(query="", sortBy="", status="approved", sortDir=1):
+def getBeatModsList(query="", sortBy="", status="approved", sortDir=1, cache=None, maxAge=0, session=None):
 
     """
     Search beatmods.com for BeatSaber mods.
@@ -80,31 +199,79 @@ def getBeatModsList(query="", sortBy="", status="approved", sortDir=1):
     If called without arguments, the default behavior is to return a
     list of all approved mods, sorted by last time updated.
 
+    If cache is set to a directory, responses are stored in it and
+    revalidated using the ETag and Last-Modified headers on the next
+    call. If the listing didn't change, the cached copy is used instead
+    of downloading it again. Cached listings younger than maxAge seconds
+    are returned without contacting the server at all.
+
+    session may be a session created by createSession() to use instead
+    of the module wide one.
+
     The return value is a list containing information about
     the different mods as dictionaries.
     """
 
     logger.debug("Searching mods...")
-    req = _getEndpoint("mod?search=%s&status=%s&sort=%s&sortDirection=%i" % (query, status, sortBy, sortDir))
-    res = request.urlopen(req)
-    mods = _parsePayload(res.read(), True)
+    qs = urlencode({"search": query, "status": status, "sort": sortBy, "sortDirection": sortDir})
+    session, url = _getEndpoint("mod?" + qs, session)
+
+    headers = {}
+    meta = None
+    if cache:
+        key = "search_" + hashlib.md5(qs.encode("utf-8")).hexdigest()
+        meta = _readCache(cache, key)
+    if meta and maxAge > 0:
+        age = time.time() - os.path.getmtime(os.path.join(cache, key + ".json"))
+        if age < maxAge:
+            logger.debug("Using cached mod listing (%i seconds old)." % age)
+            mods = _readCacheBody(cache, key)
+            if mods is not None:
+                return mods
+            meta = None
+    if meta:
+        if meta.get("etag"):
+            headers["if-none-match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["if-modified-since"] = meta["last_modified"]
+
+    res = session.get(url, headers=headers)
+    if headers and res.status_code == 304:
+        mods = _readCacheBody(cache, key)
+        if mods is not None:
+            logger.debug("Mod listing not modified, using cached copy.")
+            #the listing is confirmed to be current, restart its max age
+            os.utime(os.path.join(cache, key + ".json"))
+            return mods
+        #the cached copy is unusable, fetch the listing unconditionally
+        res = session.get(url)
+
+    res.raise_for_status()
+    #urllib3 already took care of decompressing the payload
+    mods = _loads(res.content)
+    if cache:
+        _writeCache(cache, key, res)
     logger.debug("Search query returned %i entries." % len(mods))
     return mods
 
-def downloadMod(url):
+def downloadMod(url, session=None):
 
     """
     Download a mod archive using a URL fragment as returned
     by the getBeatModsList() function.
 
-    The returned value will be a http.client.HTTPResponse,
+    The returned value will be a urllib3.response.HTTPResponse,
     which may be used as a file-like object.
+
+    session may be a session created by createSession() to use instead
+    of the module wide one.
     """
 
     logger.debug("Downloading...")
-    req = request.Request("https://beatmods.com" + url)
-    req.add_header("user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/73.0.3683.86 Safari/537.36")
-    return request.urlopen(req)
+    res = (session or _session).get("https://beatmods.com" + url, headers={"accept": "*/*"}, stream=True)
+    res.raise_for_status()
+    res.raw.decode_content = True
+    return res.raw
 
 class ModCategories(enum.Enum):
 
@@ -115,6 +282,45 @@ class ModCategories(enum.Enum):
     UI = 4
     OTHER = 5
 
+#Maps beatmods.com category names to ModCategories
+_CATEGORY_MAP = {
+    "Core": ModCategories.CORE,
+    "Libraries": ModCategories.LIBRARY,
+    "Cosmetic": ModCategories.COSMETIC,
+    "UI Enhancements": ModCategories.UI,
+    "Gameplay": ModCategories.GAMEPLAY
+    }
+
+def _parseVersion(s):
+
+    """
+    Parse a dotted version string into a list of integers.
+    """
+
+    return [int(x) for x in s.split(".")]
+
+def _computeStatus(need_install, is_remote, is_local, need_update, need_uninstall):
+
+    """
+    Determine the status key of a package from its flags.
+    """
+
+    if need_install:
+        return "install"
+    elif is_remote and not is_local:
+        return "not_installed"
+    elif is_local:
+        if need_update:
+            return "update_pending"
+        elif need_uninstall:
+            return "uninstall"
+        return "installed"
+    return ""
+
+#Every combination of status flags packed into a bit field, mapped to its
+#status key. See ModSpec.status for the bit layout.
+_STATUS_TABLE = {bits: _computeStatus(*(bits >> i & 1 for i in range(4, -1, -1))) for bits in range(32)}
+
 class ModSpec():
 
     """
@@ -154,9 +360,40 @@ class ModSpec():
     }
     """
 
+    __slots__ = (
+        "_archive",
+        "_source",
+        "id",
+        "name",
+        "version",
+        "gameVersion",
+        "dependencies",
+        "category",
+        "url",
+        "files",
+        "ignore",
+        "is_local",
+        "is_remote",
+        "need_update",
+        "need_install",
+        "need_uninstall",
+        "version_str",
+        "game_version_str"
+        )
+
     logger = logging.getLogger("beatmods.ModSpec")
 
-    def __init__(self, id, name, version, url, files=[], dependencies=[], category=ModCategories.OTHER, gameVersion=(1, 0, 0)):
+    #Human readable descriptions for the values of ModSpec.status
+    STATUS_TEXT = {
+        "install": "install",
+        "not_installed": "not installed",
+        "installed": "installed",
+        "update_pending": "update pending",
+        "uninstall": "uninstall",
+        "": ""
+        }
+
+    def __init__(self, id, name, version, url, files=None, dependencies=None, category=ModCategories.OTHER, gameVersion=(1, 0, 0)):
 
         """
         Create a new ModSpec instance.
@@ -167,15 +404,16 @@ class ModSpec():
         """
 
         self._archive = ""
+        self._source = None
 
         self.id = id
         self.name = name
         self.version = version
         self.gameVersion = gameVersion
-        self.dependencies = dependencies
+        self.dependencies = dependencies if dependencies is not None else []
         self.category = category
         self.url = url
-        self.files = files
+        self.files = files if files is not None else []
         self.ignore = False
         self.is_local = False
         self.is_remote = False
@@ -183,6 +421,10 @@ class ModSpec():
         self.need_install = False
         self.need_uninstall = False
 
+        #precomputed for display and file names
+        self.version_str = ".".join(map(str, version))
+        self.game_version_str = ".".join(map(str, gameVersion))
+
     @classmethod
     def fromSpecFile(cls, f):
 
@@ -192,7 +434,17 @@ class ModSpec():
         f should be a file-like object containing JSON data. 
         """
 
-        d = json.load(f)
+        return cls.fromSpecDict(_loads(f.read()))
+
+    @classmethod
+    def fromSpecDict(cls, d):
+
+        """
+        Create a ModSpec from the parsed contents of a spec file.
+
+        d should be a dictionary as written by writeSpecFile().
+        """
+
         id = d["id"]
         name = d["name"]
         version = d["version"]
@@ -225,24 +477,15 @@ class ModSpec():
         id = d["_id"]
         name = d["name"]
         try:
-            version = list(map(int, d["version"].split(".")))
-        except:
+            version = _parseVersion(d["version"])
+        except (AttributeError, KeyError, ValueError):
             version = [0, 0, 0]
-        gameVersion = d["gameVersion"].split(".")
-
-        c = d["category"]
-        if c == "Core":
-            cat = ModCategories.CORE
-        elif c == "Libraries":
-            cat = ModCategories.LIBRARY
-        elif c == "Cosmetic":
-            cat = ModCategories.COSMETIC
-        elif c == "UI Enhancements":
-            cat = ModCategories.UI
-        elif c == "Gameplay":
-            cat = ModCategories.GAMEPLAY
-        else:
-            cat = ModCategories.OTHER
+        try:
+            gameVersion = _parseVersion(d["gameVersion"])
+        except ValueError:
+            gameVersion = d["gameVersion"].split(".")
+
+        cat = _CATEGORY_MAP.get(d["category"], ModCategories.OTHER)
 
         downloads = {}
         for i in d["downloads"]:
@@ -299,7 +542,8 @@ class ModSpec():
             except:
                 pass
             try:
-                s = ModSpec.fromBeatMods(json.load(f))
+                with f.open("spec.json", "r") as spec:
+                    s = ModSpec.fromBeatMods(_loads(spec.read()))
                 cls.logger.debug("Successfully loaded ModSpec from archive beatmods file.")
                 return s
             except:
@@ -307,21 +551,14 @@ class ModSpec():
 
         cls.logger.debug("No archive mod spec found, creating ModSpec from archive...")
         cls.logger.debug("Creating mod package key...")
-        h = hashlib.md5()
-        entries = list(f.namelist())
-        for name in entries:
-            h.update(name.encode("utf-8"))
-        id = h.hexdigest()
+        entries = f.infolist()
+        id = hashlib.md5("".join(e.filename for e in entries).encode("utf-8")).hexdigest()
         cls.logger.debug("Archive key is '%s'." % id)
         cls.logger.debug("Processing %i entries..." % len(entries))
-        hashes = []
-        for name in entries:
-            with f.open(name, "r") as e:
-                #calculate "bogus hashes" to ensure
-                #the patcher doesn't have a heart attack
-                md5 = hashlib.md5()
-                md5.update(e.read())
-                hashes.append({"file": name, "hash": md5.hexdigest()})
+        #use the CRC-32 stored in the archive as "bogus hashes" to ensure
+        #the patcher doesn't have a heart attack. This way we don't have
+        #to decompress the entire archive just to fill in the file list.
+        hashes = [{"file": e.filename, "hash": "%08x" % e.CRC} for e in entries if not e.is_dir()]
 
         modName = pathlib.Path(f.filename).name
         cls.logger.debug("Package name is '%s'." % modName)
@@ -355,10 +592,27 @@ class ModSpec():
         d["files"] = self.files
         d["dependencies"] = self.dependencies
 
-        json.dump(d, f)
+        f.write(_dumps(d))
 
         return f
 
+    @property
+    def status(self):
+
+        """
+        The current status of this package.
+
+        This is one of the keys of ModSpec.STATUS_TEXT.
+        """
+
+        return _STATUS_TABLE[
+            bool(self.need_install) << 4
+            | bool(self.is_remote) << 3
+            | bool(self.is_local) << 2
+            | bool(self.need_update) << 1
+            | bool(self.need_uninstall)
+            ]
+
     def __lt__(self, other):
 
         if isinstance(other, ModSpec):
@@ -419,8 +673,14 @@ class Patcher():
         self.setPath(path)
 
         self.app_type= app_type
+        self.cache_ttl = REMOTE_CACHE_TTL
+        self._session = createSession()
         self.remote = []
         self.local = []
+        self._remote_by_name = {}
+        self._local_by_name = {}
+        self._local_cache = {}
+        self._dep_order = {}
         self.need_install = []
         self.need_uninstall = []
         self.need_update = []
@@ -440,15 +700,18 @@ class Patcher():
         """
 
         self.path = pathlib.Path(path)
+        self._path_str = str(self.path)
         self.app_dir = self.path / ".bsmm"
         self.download_cache = self.app_dir / "cache"
         self.manifest_cache = self.app_dir / "meta"
+        self.remote_cache = self.app_dir / "remote"
 
         self.logger.debug("Application path is now %s" % self.path)
 
         #setup paths
         os.makedirs(self.download_cache, exist_ok=True)
         os.makedirs(self.manifest_cache, exist_ok=True)
+        os.makedirs(self.remote_cache, exist_ok=True)
 
         self.logger.debug("Created temporary directory %s" % self.app_dir)
 
@@ -463,21 +726,24 @@ class Patcher():
         self.need_uninstall.clear()
         self.need_update.clear()
 
-        self.getLocal()
-        self.getRemote()
+        #fetch the remote listing while we are busy reading the local manifests
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            remote = executor.submit(self.getRemote)
+            self.getLocal()
+            remote.result()
 
         if not doUpdate:
             return
 
         self.logger.info("Checking for updates...")
         for spec in self.local:
-            for rspec in self.remote:
-                if spec.name == rspec.name:
-                    rspec.is_local = True
-                    if spec.version < rspec.version:
-                        self.logger.debug("Mod '%s' is out of date, staged for automatic upate." % spec.name)
-                        spec.need_update = True
-                        self.need_update.append(spec)
+            rspec = self._remote_by_name.get(spec.name)
+            if rspec:
+                rspec.is_local = True
+                if spec.version < rspec.version:
+                    self.logger.debug("Mod '%s' is out of date, staged for automatic upate." % spec.name)
+                    spec.need_update = True
+                    self.need_update.append(spec)
 
     def getLocal(self, sort=True):
 
@@ -489,29 +755,100 @@ class Patcher():
         """
 
         self.local.clear()
-        for path in self.manifest_cache.iterdir():
-            if str(path).endswith(".json"):
-                with open(path, "r") as f:
-                    spec = ModSpec.fromSpecFile(f)
-                    if not spec.ignore:
-                        self.local.append(spec)
+        cache = {}
+        with os.scandir(self.manifest_cache) as it:
+            for entry in it:
+                if not entry.name.endswith(".json") or not entry.is_file():
+                    continue
+                #only parse manifests that changed since the last call
+                st = entry.stat()
+                key = (st.st_mtime_ns, st.st_size)
+                cached = self._local_cache.get(entry.path)
+                if cached and cached[0] == key:
+                    d = cached[1]
+                else:
+                    with open(entry.path, "rb") as f:
+                        d = _loads(f.read())
+                cache[entry.path] = (key, d)
+
+                spec = ModSpec.fromSpecDict(d)
+                if not spec.ignore:
+                    self.local.append(spec)
+        self._local_cache = cache
 
         self.local.sort()
+        self._local_by_name = {spec.name: spec for spec in self.local}
 
     def getRemote(self, query="", sortBy="name_lower", sortDir=1):
 
         """
         Populates the remote mod list using
         the beatmods.com API.
+
+        Listings are cached for cache_ttl seconds. Set
+        cache_ttl to 0 to always check for a new listing.
         """
 
-        self.remote.clear()
-        mods = getBeatModsList(query, sortBy, sortDir=sortDir)
-        for mod in mods:
-            spec = ModSpec.fromBeatMods(mod, self.app_type)
-            self.remote.append(spec)
+        mods = getBeatModsList(query, sortBy, sortDir=sortDir, cache=self.remote_cache, maxAge=self.cache_ttl, session=self._session)
+        self.remote[:] = [ModSpec.fromBeatMods(mod, self.app_type) for mod in mods]
+        self._remote_by_name = {spec.name: spec for spec in self.remote}
+        self._updateDependencyOrder()
 
-    def _installMod(self, spec):
+    def _updateDependencyOrder(self):
+
+        """
+        Sort the remote mods topologically using Kahn's algorithm,
+        so that every mod comes after all of its dependencies.
+
+        Mods that are part of a dependency cycle are put at the end.
+        """
+
+        in_degree = {}
+        reverse_graph = defaultdict(list)
+        for spec in self._remote_by_name.values():
+            deps = {d["name"] for d in spec.dependencies}
+            deps.discard(spec.name)
+            deps.intersection_update(self._remote_by_name)
+            in_degree[spec.name] = len(deps)
+            for dep in deps:
+                reverse_graph[dep].append(spec.name)
+
+        queue = deque(name for name, degree in in_degree.items() if degree == 0)
+        order = []
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for dependent in reverse_graph[name]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        if len(order) < len(in_degree):
+            cyclic = [name for name, degree in in_degree.items() if degree > 0]
+            self.logger.warn("Circular dependencies detected between mods: %s" % ", ".join(cyclic))
+            order.extend(cyclic)
+
+        self._dep_order = {name: i for i, name in enumerate(order)}
+
+    def getLocalSpec(self, name):
+
+        """
+        Return the local ModSpec with the given name,
+        or None if no such mod is installed.
+        """
+
+        return self._local_by_name.get(name)
+
+    def getRemoteSpec(self, name):
+
+        """
+        Return the remote ModSpec with the given name,
+        or None if beatmods.com doesn't know about it.
+        """
+
+        return self._remote_by_name.get(name)
+
+    def _installMod(self, spec, verify=True):
 
         """
         Patches a mod into BeatSaber.
@@ -519,6 +856,11 @@ class Patcher():
         spec must be a ModSpec instance.
         The mod must be downloaded into the local
         cache directory.
+
+        If verify is True, the files are checked against the MD5
+        hashes of the spec while they are being extracted. Files are
+        only moved into place once the entire archive was extracted
+        successfully.
         """
 
         #TODO: Only install files covered by the spec file
@@ -535,19 +877,60 @@ class Patcher():
         except (OSError, zipfile.error):
             raise RuntimeError("Unable to open file '%s', probably bad download." % p1)
 
-        for member in archive.infolist():
-            if member.is_dir():
-                logger.debug("Member '%s' is a directory, skipping..." % member.filename)
-                continue
-            p2 = self.path / member.filename
-
-            logger.info("Creating file '%s'..." % p2)
-            parent = p2.parent
-            os.makedirs(parent, exist_ok=True)
-            with open(p2, "wb") as f:
-                f.write(archive.read(member))
+        hashes = {}
+        if verify:
+            self.logger.debug("Verifying download...")
+            hashes = {i["file"]: i["hash"].lower() for i in spec.files}
 
-        archive.close()
+        staged = []
+        dirs = set()
+        try:
+            with archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        logger.debug("Member '%s' is a directory, skipping..." % member.filename)
+                        continue
+                    p2 = os.path.join(self._path_str, member.filename)
+                    tmp = p2 + ".bsmm-tmp"
+
+                    parent = os.path.dirname(p2)
+                    if not parent in dirs:
+                        os.makedirs(parent, exist_ok=True)
+                        dirs.add(parent)
+                    h = hashlib.md5() if verify else None
+                    with archive.open(member) as src, open(tmp, "wb") as dst:
+                        staged.append((tmp, p2))
+                        for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+                            if h:
+                                h.update(chunk)
+                            dst.write(chunk)
+
+                    #beatmods.com provides a separate hash for each archive member
+                    #instead of one for the whole archive, so we have to check
+                    #every file. Damaged downloads are also caught here, since
+                    #the zipfile module checks the CRC-32 of each member once
+                    #it has been read completely.
+                    if not verify:
+                        continue
+                    if not member.filename in hashes:
+                        logger.warn("No hash entry found for file '%s', bad archive?" % member.filename)
+                    elif h.hexdigest() != hashes[member.filename]:
+                        raise RuntimeError("MD5 mismatch for file '%s'." % member.filename)
+
+            #Renames can still fail, i.e. if the game is running and keeps
+            #a plugin locked, so don't leave any staged files behind then
+            for tmp, p2 in staged:
+                logger.info("Creating file '%s'..." % p2)
+                os.replace(tmp, p2)
+        except BaseException as e:
+            for tmp, p2 in staged:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            if isinstance(e, zipfile.BadZipFile):
+                raise RuntimeError("Corrupted archive '%s': %s" % (p1, str(e)))
+            raise
 
         #Create local spec file
         spec.is_remote = False
@@ -589,7 +972,7 @@ class Patcher():
         Return a filename suitable for serialized ModSpec files.
         """
 
-        return "%s_%s.json" % (spec.name, ".".join(map(str, spec.version)))
+        return "%s_%s.json" % (spec.name, spec.version_str)
 
     def _writeSpec(self, spec):
 
@@ -606,51 +989,7 @@ class Patcher():
         Return a filename suitable for mod downloads.
         """
 
-        return "%s_%s.zip" % (spec.name, ".".join(map(str, spec.version)))
-
-    def _verifyArchive(self, spec, path):
-
-        """
-        Verify the integrity of the downloaded mod archive
-        by comparing the files inside with the provided MD5
-        hashes.
-        """
-
-        self.logger.debug("Verifying download...")
-
-        hashes = {}
-        for i in spec.files:
-            hashes[i["file"]] = i["hash"]
-
-        try:
-            archive = zipfile.ZipFile(path, "r")
-        except (OSError, zipfile.error):
-            self.logger.error("Unable to open file '%s', probably bad download." % path)
-            return False
-
-        for member in archive.infolist():
-            if member.is_dir():
-                self.logger.debug("Member '%s' is a directory, skipping..." % member.filename)
-                continue
-        
-            #We're relying on the fact here that no errors occur while copying
-            #the files from the archive to the disk. I trust the operating
-            #system to be capable of ensuring that data is written in a
-            #way that ensures integrity. The main risk comes from incomplete
-            #dowloads or drive-by malware, which would be caught by a simple
-            #hash for each archive. For some reason though, the guys over at
-            #beatmods.com decided to include a separate hash for each archive
-            #member instead.
-            if not member.filename in hashes:
-                logger.warn("No hash entry found for file '%s', bad archive?" % member.filename)    
-                
-            else:
-                logger.debug("Validating file '%s'..." % member.filename)
-                if not validateFile(archive.read(member.filename), hashes[member.filename]):
-                    raise RuntimeError("MD5 mismatch for file '%s'." % member.filename)
-
-        archive.close()
-        return True
+        return "%s_%s.zip" % (spec.name, spec.version_str)
 
     def _downloadMod(self, spec):
 
@@ -661,14 +1000,13 @@ class Patcher():
         """
 
         self.logger.debug("Downloading mod '%s'..." % spec.name)
-        f = downloadMod(spec.url)
         name = self._getArchiveName(spec)
         p = self.download_cache / name
-        with open(p, "wb") as f2:
-            f2.write(f.read())
+        with downloadMod(spec.url, self._session) as f, open(p, "wb") as f2:
+            #copy in chunks so we never hold the whole archive in memory
+            shutil.copyfileobj(f, f2, DOWNLOAD_CHUNK_SIZE)
 
         spec._archive = p
-        self._verifyArchive(spec, p)
 
         return True
 
@@ -682,7 +1020,8 @@ class Patcher():
         to dead code from older versions.
 
         Next, all core mods that need to be updated or installed will be patched.
-        After this, all other mods are patched in order of first in first out.
+        After this, all other mods are patched. Within both groups, dependencies
+        are always installed before the mods depending on them.
         """
 
         self.logger.info("Uninstalling mods...")
@@ -706,26 +1045,40 @@ class Patcher():
             #We don't need bother removing the old local version from the list as its
             #spec file is automatically deleted and everything will be
             #reloaded after the patch is complete.
-            for remote in self.remote:
-                if remote.name == mod.name:
-                    install.append(remote)
-                    break
+            remote = self._remote_by_name.get(mod.name)
+            if remote:
+                install.append(remote)
             else:
                 self.logger.warn("Unable to find remote spec for mod '%s', skipping" % mod.name)
         install.extend(self.need_install)
 
         self.logger.info("Downloading mods...")
-        for mod in install[:]:
-            if mod._archive:
-                self.logger.info("Skipping package '%s' download, found local copy at '%s'." % (mod.name, mod._archive))
-                continue
-            try:
-                self._downloadMod(mod)
-            except Exception as e:
-                self.logger.exception("Downloading mod '%s' failed:" % mod.name)
-                #here we are removing mods that have failed downloading
-                #to speed up installation and prevent errors down the line
-                install.remove(mod)
+        failed = set()
+        downloaded = set()
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            futures = {}
+            for mod in install:
+                if mod._archive:
+                    self.logger.info("Skipping package '%s' download, found local copy at '%s'." % (mod.name, mod._archive))
+                    continue
+                futures[executor.submit(self._downloadMod, mod)] = mod
+                downloaded.add(mod)
+
+            for future in as_completed(futures):
+                mod = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.exception("Downloading mod '%s' failed:" % mod.name)
+                    failed.add(mod)
+
+        #here we are removing mods that have failed downloading
+        #to speed up installation and prevent errors down the line
+        install = [mod for mod in install if mod not in failed]
+
+        #Install dependencies before the mods that need them. Mods we
+        #don't know the order for (i.e. local packages) go last.
+        install.sort(key=lambda mod: self._dep_order.get(mod.name, len(self._dep_order)))
 
         #Install core mods first, then everything else.
         #Technically this shouldn't be necessary because of how
@@ -746,23 +1099,24 @@ class Patcher():
         self.logger.info("Installing core mods...")
         for mod in core_install:
             try:
-                self._installMod(mod)
+                #local archives only carry placeholder hashes, so we
+                #only verify what we downloaded ourselves
+                self._installMod(mod, mod in downloaded)
             except Exception as e:
                 self.logger.exception("Installing mod '%s' failed:" % mod.name)
 
         self.logger.info("Installing generic mods...")
         for mod in generic_install:
             try:
-                self._installMod(mod)
+                #local archives only carry placeholder hashes, so we
+                #only verify what we downloaded ourselves
+                self._installMod(mod, mod in downloaded)
             except Exception as e:
                 self.logger.exception("Installing mod '%s' failed:" % mod.name)
 
         self.logger.info("Cleaning up...")
-        for i in list(self.download_cache.iterdir()):
-            try:
-                os.remove(i)
-            except OSError:
-                pass
+        shutil.rmtree(self.download_cache, ignore_errors=True)
+        os.makedirs(self.download_cache, exist_ok=True)
 
         self.logger.info("Done!")
 
@@ -772,12 +1126,12 @@ class Patcher():
         Runs the patcher twice, removing and subsequently re-adding all
         installed mod packages.
         Use this to resolve issues with corrupted mod installations.
+
+        Reinstalled packages are installed in dependency order
+        by patch().
         """
 
-        specs = []
-        for spec in self.remote:
-            if spec.is_local:
-                specs.append(spec)
+        specs = [spec for spec in self.remote if spec.is_local]
 
         self.logger.info("Removing all mods...")
         for mod in specs:
@@ -809,29 +1163,28 @@ class Patcher():
             self.logger.info("Installing mod '%s' from dependency '%s'..." % (spec.name, fromSpec.name))
 
         #Step one: check if package is already installed:
-        for mod in self.local:
-            if mod.name == spec.name:
-                if mod.need_uninstall:
-                    #package is installed but marked for uninstallation, remove marker
-                    self.logger.info("Package '%s' is marked for uninstallation, readding..." % mod.name)
-                    try:
-                        self.need_uninstall.remove(mod)
-                    except:
-                        pass
-                    mod.need_uninstall = False
-                    return
-                elif mod.need_install:
-                    #mod already marked for install, skip silently
-                    return
-                else:
-                    self.logger.info("Mod package '%s' is already installed, skipping." % spec.name)
-                    return
+        mod = self._local_by_name.get(spec.name)
+        if mod:
+            if mod.need_uninstall:
+                #package is installed but marked for uninstallation, remove marker
+                self.logger.info("Package '%s' is marked for uninstallation, readding..." % mod.name)
+                try:
+                    self.need_uninstall.remove(mod)
+                except:
+                    pass
+                mod.need_uninstall = False
+                return
+            elif mod.need_install:
+                #mod already marked for install, skip silently
+                return
+            else:
+                self.logger.info("Mod package '%s' is already installed, skipping." % spec.name)
+                return
 
         #Step two: get remote package
-        for mod in self.remote:
-            if mod.name == spec.name:
-                spec = mod
-                break
+        mod = self._remote_by_name.get(spec.name)
+        if mod:
+            spec = mod
         else:
             self.logger.warn("Mod package '%s' isn't in the remote repository, installing in local only mode." % spec.name)
 
@@ -841,6 +1194,7 @@ class Patcher():
         #Step three: Mark for install
         spec.need_install = True
         self.local.append(spec)
+        self._local_by_name[spec.name] = spec
         self.need_install.append(spec)
 
         #Step four: Process dependencies
@@ -848,18 +1202,16 @@ class Patcher():
             dep = depend["name"]
             self.logger.debug("Searching for local package '%s'..." % dep)
             
-            for mod in self.local:
-                if mod.name == dep:
-                    self.logger.debug("Found installation for package on local machine, skipping")
-                    break
+            if dep in self._local_by_name:
+                self.logger.debug("Found installation for package on local machine, skipping")
+                continue
+
+            self.logger.debug("Searching for remote package '%s'..." % dep)
+            mod = self._remote_by_name.get(dep)
+            if mod:
+                self.addMod(mod, spec)
             else:
-                self.logger.debug("Searching for remote package '%s'..." % dep)
-                for mod in self.remote:
-                    if mod.name == dep:
-                        self.addMod(mod, spec)
-                        break
-                else:
-                    self.logger.warn("Unable to install dependency package '%s' for mod '%s': Package not found." % (dep, spec.name))
+                self.logger.warn("Unable to install dependency package '%s' for mod '%s': Package not found." % (dep, spec.name))
 
         self.logger.info("Mod package '%s' staged for installation." % spec.name)
         return True
@@ -881,6 +1233,7 @@ class Patcher():
             self.need_install.remove(spec)
             spec.need_install = False
             self.local.remove(spec)
+            self._local_by_name.pop(spec.name, None)
             self.logger.info("Unstaging mod '%s' from installation." % spec.name)
             return True
         elif not spec.is_local:
@@ -1,37 +1,30 @@
 import logging
 import argparse
-import json
+import functools
+import os
 import sys
 
-from beatmodsapi import Patcher, APP_TYPE
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("bsmm.cli")
 
 def getStatusMsg(spec):
 
-    if spec.need_install:
-        status = "install"
-    elif spec.is_remote and not spec.is_local:
-        status = "not installed"
-    elif spec.is_local:
-        #installed
-        if spec.need_update:
-            status = "update pending"
-        elif spec.need_uninstall:
-            status = "uninstall"
-        else:
-            status = "installed"
-    else:
-        status = ""
-
-    return status
+    return spec.STATUS_TEXT[spec.status]
+
+@functools.lru_cache()
+def _loadConfig(path, mtime):
+
+    #mtime is only part of the cache key, so changes to the file are picked up
+    with open(path, "rb") as f:
+        return _loads(f.read())
 
 def getPath():
 
-    with open("config.json", "r") as f:
-        d = json.load(f)
-    return d["application_path"]
+    return _loadConfig("config.json", os.stat("config.json").st_mtime_ns)["application_path"]
 
 def searchMods(args):
 
@@ -39,10 +32,9 @@ def searchMods(args):
 
     logger.debug("Fetching remote listing...")
     patcher.getRemote(args.query)
-    print("Search results:\n")
-    for spec in patcher.remote:
-
-        print("%s (v%s)" % (spec.name, ".".join(map(str, spec.version))))
+    lines = ["Search results:\n"]
+    lines.extend("%s (v%s)" % (spec.name, spec.version_str) for spec in patcher.remote)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def listMods(args):
 
@@ -50,11 +42,9 @@ def listMods(args):
 
     logger.debug("Fetching local listing...")
     patcher.getLocal()
-    print("Installed mods:\n")
-    for spec in patcher.local:
-
-        status = getStatusMsg(spec)
-        print("%s (v%s) %s" % (spec.name, ".".join(map(str, spec.version)), status))
+    lines = ["Installed mods:\n"]
+    lines.extend("%s (v%s) %s" % (spec.name, spec.version_str, getStatusMsg(spec)) for spec in patcher.local)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def installMods(args):
 
@@ -63,11 +53,8 @@ def installMods(args):
     mod = args.name
     logger.debug("Installing mod '%s'..." % mod)
     patcher.refreshMods(False)
-    for s in patcher.remote:
-        if s.name == mod:
-            spec = s
-            break
-    else:
+    spec = patcher.getRemoteSpec(mod)
+    if not spec:
         raise RuntimeError("Unable to install mod '%s': Package not found in remote repository." % mod)
 
     patcher.addMod(spec)
@@ -75,7 +62,7 @@ def installMods(args):
     for mod in patcher.need_install:
         print("    "+mod.name)
     cont = input("Do you wish to continue? (y/n) [y]: ")
-    if cont.lower() == n:
+    if cont.strip().lower() not in ("", "y", "yes"):
         return
 
     patcher.patch()
@@ -88,62 +75,79 @@ def uninstallMods(args):
     logger.debug("Uninstalling mod '%s'..." % mod)
     patcher.getLocal()
 
-    for s in patcher.local:
-        if s.name == mod:
-            spec = s
-            break
-    else:
+    spec = patcher.getLocalSpec(mod)
+    if not spec:
         raise RuntimeError("Unable to uninstall mod '%s': Package not found in local repository." % mod)
 
     patcher.removeMod(spec, args.force)
     patcher.patch()
 
-parser = argparse.ArgumentParser(description="Command line utility for managing BeatSaber mods.")
-parser.add_argument("--launch", action="store_true", help="Launch the game after executing the command.")
-parser.add_argument("--update", action="store_true", help="Update all mods before executing the command.")
-parser.add_argument("--path", action="store", help="Specify the path to the BeatSaber installation.")
-parser.add_argument("--app_type", action="store", help="Specify the application type, typicaly 'steam' or 'oculus'.")
-operations = parser.add_subparsers()
-
-search = operations.add_parser("search", help="Search beatmods.com for mod packages.")
-search.add_argument("query", nargs="?", default="")
-search.set_defaults(func=searchMods)
-
-install = operations.add_parser("install", help="Install a package.")
-install.add_argument("name")
-install.add_argument("--nodep", action="store_true", help="Don't install dependencies.")
-install.set_defaults(func=installMods)
-
-remove = operations.add_parser("remove", help="Uninstall a package.")
-remove.add_argument("name")
-remove.add_argument("--force", action="store_true", help="Force uninstall.")
-remove.set_defaults(func=uninstallMods)
-
-list = operations.add_parser("list", help="List installed mods.")
-list.set_defaults(func=listMods)
-
-args = parser.parse_args()
-
-path = args.path
-if not path:
-    try:
-        path = getPath()
-    except (OSError, KeyError):
-        logger.fatal("Unable to load configuration file, must specify a path!")
-        sys.exit(1)
-
-app_type = args.app_type or APP_TYPE
-
-patcher = Patcher(path, app_type)
-if args.update:
-    patcher.refreshMods()
-    patcher.patch()
+def buildParser():
 
-try:
-    args.func(args)
-except AttributeError:
-    pass #No action specified, just exit
+    parser = argparse.ArgumentParser(description="Command line utility for managing BeatSaber mods.")
+    parser.add_argument("--launch", action="store_true", help="Launch the game after executing the command.")
+    parser.add_argument("--update", action="store_true", help="Update all mods before executing the command.")
+    parser.add_argument("--path", action="store", help="Specify the path to the BeatSaber installation.")
+    parser.add_argument("--app_type", action="store", help="Specify the application type, typicaly 'steam' or 'oculus'.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the cached beatmods.com listing.")
+    operations = parser.add_subparsers()
+
+    search = operations.add_parser("search", help="Search beatmods.com for mod packages.")
+    search.add_argument("query", nargs="?", default="")
+    search.set_defaults(func=searchMods)
+
+    install = operations.add_parser("install", help="Install a package.")
+    install.add_argument("name")
+    install.add_argument("--nodep", action="store_true", help="Don't install dependencies.")
+    install.set_defaults(func=installMods)
+
+    remove = operations.add_parser("remove", help="Uninstall a package.")
+    remove.add_argument("name")
+    remove.add_argument("--force", action="store_true", help="Force uninstall.")
+    remove.set_defaults(func=uninstallMods)
+
+    listCmd = operations.add_parser("list", help="List installed mods.")
+    listCmd.set_defaults(func=listMods)
+
+    return parser
+
+def main():
+
+    global patcher
+
+    args = buildParser().parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    #only pull in the API client (and requests) once we actually need it
+    from beatmodsapi import Patcher, APP_TYPE
+
+    path = args.path
+    if not path:
+        try:
+            path = getPath()
+        except (OSError, KeyError):
+            logger.fatal("Unable to load configuration file, must specify a path!")
+            sys.exit(1)
+
+    app_type = args.app_type or APP_TYPE
+
+    patcher = Patcher(path, app_type)
+    if args.no_cache:
+        patcher.cache_ttl = 0
+    if args.update:
+        patcher.refreshMods()
+        patcher.patch()
+
+    func = getattr(args, "func", None)
+    if func:
+        func(args)
+    #No action specified, just exit
+
+    if args.launch:
+        #TODO: launch the game
+        pass
+
+if __name__ == "__main__":
 
-if args.launch:
-    #TODO: launch the game
-    pass
+    main()
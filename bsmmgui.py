@@ -6,10 +6,15 @@
 import json
 import logging
 import os
-import subprocess
-import zipfile
-import pathlib
 import sys
+import threading
+
+try:
+    from orjson import loads as _loads, dumps as _dumps
+except ImportError:
+    from json import loads as _loads
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
 
 from tkinter import *
 from tkinter.ttk import *
@@ -19,6 +24,30 @@ from tkinter import filedialog
 import beatmodsapi
 from beatmodsapi import APP_TYPE
 
+#Tags used to highlight the different package states
+STATUS_TAGS = {
+    "install": "green",
+    "update_pending": "orange",
+    "uninstall": "red"
+    }
+
+def _rowForSpec(spec):
+
+    """
+    Return the column values and tags used to display a ModSpec.
+    """
+
+    #Show dependencies
+    source = spec._source
+    source = "from "+source.name if source else ""
+
+    #Display current package status
+    key = spec.status
+    tag = STATUS_TAGS.get(key)
+    tags = [tag] if tag else []
+
+    return [spec.name, spec.version_str, spec.STATUS_TEXT[key], source, spec.game_version_str], tags
+
 class ModView(Frame):
 
     COLUMNS = [
@@ -35,14 +64,22 @@ class ModView(Frame):
         "orange": {"foreground": "orange"}
         }
 
+    PAGE_SIZE = 50 #rows are inserted in pages, more are added when scrolling down
+
     logger = logging.getLogger("bsmmgui.ModView")
 
     def __init__(self, master=None):
 
         super().__init__(master)
-        self.tree = Treeview(self, columns=self.COLUMNS, displaycolumns="#all", show="headings", selectmode="browse")
 
         self.specCache = {}
+        self.iidCache = {}
+        self.specs = []
+        self._rendered = 0
+        self._loadPending = False
+
+        self.tree = Treeview(self, columns=self.COLUMNS, displaycolumns="#all", show="headings", selectmode="browse",
+                             yscrollcommand=self._onScroll)
         self._prepare()
 
         self.tree.pack(fill="both")
@@ -55,44 +92,11 @@ class ModView(Frame):
         for col in self.COLUMNS:
             self.tree.heading(col, text=col)
 
-    def _add(self, spec):
-
-        tags = []
-
-        #Show dependencies
-        source = getattr(spec, "_source", "")
-        if source:
-            source = "from "+source.name
-        
-        #Display current package status
-        if spec.need_install:
-            status = "install"
-            tags.append("green")
-        elif spec.is_remote and not spec.is_local:
-            status = "not installed"
-        elif spec.is_local:
-            #installed
-            if spec.need_update:
-                status = "update pending"
-                tags.append("orange")
-            elif spec.need_uninstall:
-                status = "uninstall"
-                tags.append("red")
-            else:
-                status = "installed"
-        else:
-            status = ""
-
-        version = ".".join(map(str, spec.version))
-        gameVersion = ".".join(map(str, spec.gameVersion))
-
-        iid = self.tree.insert("", END, values=[spec.name, version, status, source, gameVersion], tags=tags)
-        self.specCache[iid] = spec #keep a reference for the event handlers
-
     def clear(self):
 
-        for item in self.tree.get_children(""):
-            self.tree.delete(item)
+        children = self.tree.get_children("")
+        if children:
+            self.tree.delete(*children)
 
     def updateView(self, specs):
 
@@ -101,9 +105,61 @@ class ModView(Frame):
         """
 
         self.specCache.clear()
+        self.iidCache.clear()
         self.clear()
-        for mod in specs:
-            self._add(mod)
+
+        #Only the first page is inserted right away. Drawing hundreds of
+        #rows nobody is looking at is what makes large lists slow.
+        self.specs = list(specs)
+        self._rendered = 0
+        self._loadMore()
+
+    def _loadMore(self):
+
+        """
+        Insert the next page of rows into the tree.
+        """
+
+        self._loadPending = False
+        start = self._rendered
+
+        #build all rows first, then insert them in one tight loop
+        rows = [(spec,) + _rowForSpec(spec) for spec in self.specs[start:start + self.PAGE_SIZE]]
+        insert = self.tree.insert
+        cache = self.specCache
+        iids = self.iidCache
+        end = END
+        for spec, values, tags in rows:
+            iid = insert("", end, values=values, tags=tags)
+            cache[iid] = spec #keep a reference for the event handlers
+            iids[spec.name] = iid
+
+        self._rendered = start + len(rows)
+
+    def _onScroll(self, first, last):
+
+        #Called by the tree whenever the visible area changes.
+        #Once the last inserted row comes into view, load the next page.
+        if float(last) < 1.0 or self._loadPending or self._rendered >= len(self.specs):
+            return
+        self._loadPending = True
+        self.after_idle(self._loadMore)
+
+    def updateSpec(self, spec):
+
+        """
+        Redraw the row of the package spec belongs to.
+
+        Rows are matched by package name and redrawn from the spec
+        they were created from. Rows that haven't been inserted yet
+        are skipped, they will be current once they are.
+        """
+
+        iid = self.iidCache.get(spec.name)
+        if iid is None:
+            return
+        values, tags = _rowForSpec(self.specCache[iid])
+        self.tree.item(iid, values=values, tags=tags)
 
     def getSelected(self):
 
@@ -123,11 +179,14 @@ class App(Frame):
 
     logger = logging.getLogger("bsmmgui.app")
 
+    REFRESH_POLL_INTERVAL = 100 #ms
+
     def __init__(self, master = None, cnf = {}, **kw):
         
         super().__init__(master)
 
         self.loadSettings()
+        self._gameExe = None
 
         self.pathLabel = Label(self, text="BeatSaber installation path:")
         self.pathLabel.pack()
@@ -149,6 +208,8 @@ class App(Frame):
         self.btnExit = Button(self.btnPanel, text="Exit", command=self.quit)
         self.btnExit.pack(anchor="w", side="left")
         self.btnPanel.pack(fill="x")
+        self.statusLabel = Label(self, text="")
+        self.statusLabel.pack(anchor="w")
 
         self.modListFrame = Frame(self)
         self.mlLabel = Label(self.modListFrame, text="Available mods:")
@@ -175,11 +236,12 @@ class App(Frame):
     def loadSettings(self):
 
         self.settings = {}
-        try:
-            with open("config.json", "rb") as f:
-                self.settings = json.load(f)
-        except:
-            print("WARNING: Unable to load settings")
+        if os.path.exists("config.json"):
+            try:
+                with open("config.json", "rb") as f:
+                    self.settings = _loads(f.read())
+            except (OSError, ValueError) as e:
+                print("WARNING: Unable to load settings: %s" % str(e))
 
         logging.basicConfig(level=self.settings.get("log_level", logging.INFO))
 
@@ -188,12 +250,16 @@ class App(Frame):
         self.modListView.updateView(self.patcher.remote)
         self.installListView.updateView(self.patcher.local)
 
-    def initPatcher(self):
+    def initPatcher(self, useCache=True):
 
         """
         Inits the patcher system.
         This method will (re)load the patcher instance, sync with
         remote and update the listviews.
+        Syncing happens in the background, the listviews are
+        updated once it has completed.
+        If useCache is False, the cached remote listing is
+        revalidated with beatmods.com.
         """
 
         path = self.pathEntry.get()
@@ -205,12 +271,50 @@ class App(Frame):
             self.pathEntry.delete(0, END)
             self.pathEntry.insert(0, path)
         self.patcher = beatmodsapi.Patcher(path, APP_TYPE)
-        self.patcher.refreshMods()
+        if not useCache:
+            self.patcher.cache_ttl = 0
+
+        self._setBusy(True)
+        self._refreshError = None
+        self._refreshThread = threading.Thread(target=self._refreshInBackground, daemon=True)
+        self._refreshThread.start()
+        self.after(self.REFRESH_POLL_INTERVAL, self._checkRefresh)
+
+    def _refreshInBackground(self):
+
+        #runs on the worker thread, so we must not touch any widgets here
+        try:
+            self.patcher.refreshMods()
+        except Exception as e:
+            self.logger.exception("Refreshing mod lists failed:")
+            self._refreshError = e
+
+    def _checkRefresh(self):
+
+        if self._refreshThread.is_alive():
+            self.after(self.REFRESH_POLL_INTERVAL, self._checkRefresh)
+            return
+
+        self._setBusy(False)
         self.updateViews()
+        if self._refreshError:
+            messagebox.showerror("Refresh Failed", "Unable to load mod lists: %s" % str(self._refreshError))
+
+    def _setBusy(self, busy):
+
+        """
+        Disable all controls that use the patcher while it is
+        being refreshed.
+        """
+
+        state = ["disabled"] if busy else ["!disabled"]
+        for btn in (self.btnRefresh, self.btnReinstall, self.btnLocal, self.btnPatch, self.btnMoveToInstall, self.btnMoveToAvailable):
+            btn.state(state)
+        self.statusLabel.configure(text="Refreshing..." if busy else "")
 
     def refreshModList(self, event=None):
 
-        self.initPatcher()
+        self.initPatcher(False)
 
     def patchMods(self, event=None):
 
@@ -223,8 +327,14 @@ class App(Frame):
         s = self.modListView.getSelected()
         if not s:
             return
+        staged = set(self.patcher.need_install)
         self.patcher.addMod(s)
-        self.updateViews()
+
+        #only the newly staged packages changed in the remote list
+        for spec in self.patcher.need_install:
+            if not spec in staged:
+                self.modListView.updateSpec(spec)
+        self.installListView.updateView(self.patcher.local)
 
     def removeFromList(self, event=None):
         
@@ -238,19 +348,47 @@ class App(Frame):
             again = messagebox.askyesno("Dependency Warning", msg % str(e))
             if again:
                 self.patcher.removeMod(s, True) #Force deinstallation
-        self.updateViews()
+        self.modListView.updateSpec(s)
+        self.installListView.updateView(self.patcher.local)
+
+    def _getGameExecutable(self):
+
+        """
+        Return the path of the game executable, or None if it
+        doesn't exist.
+        The path is cached for as long as the installation
+        path stays the same.
+        """
+
+        root = self.pathEntry.get()
+        if self._gameExe and self._gameExe[0] == root:
+            return self._gameExe[1]
+
+        exe = os.path.join(root, "Beat Saber.exe")
+        if not os.path.isfile(exe):
+            return None
+        self._gameExe = (root, exe)
+        return exe
 
     def start(self, event=None):
 
-        path = pathlib.Path(os.path.join(self.pathEntry.get(), "Beat Saber.exe"))
-        if path.is_file():
+        import subprocess
+
+        path = self._getGameExecutable()
+        if path:
+            kwargs = {}
+            if sys.platform == "win32":
+                #don't tie the game to our console
+                kwargs["creationflags"] = subprocess.DETACHED_PROCESS
             try:
-                subprocess.Popen(path)
+                subprocess.Popen(path, close_fds=True, **kwargs)
             except OSError:
                 self.logger.exception("Unable to launch executable: ")
 
     def addLocalPackage(self, event=None):
 
+        import zipfile
+
         p = filedialog.askopenfilename(initialdir=os.getcwd())
         try:
             f = zipfile.ZipFile(p, mode="r")
@@ -281,10 +419,10 @@ Do you wish to continue?"""
         self.settings["application_path"] = self.pathEntry.get()
 
         try:
-            with open("config.json", "w") as f:
-                json.dump(self.settings, f)
-        except:
-            self.logger.warn("Failed to save config.")
+            with open("config.json", "wb") as f:
+                f.write(_dumps(self.settings))
+        except OSError as e:
+            self.logger.warn("Failed to save config: %s" % str(e))
         return super().quit()
 
 if __name__ == "__main__":